@@ -0,0 +1,143 @@
+"""
+Peak-RSS benchmark for reel overlay preparation.
+
+Renders a 1080x1920 reel with four overlays (three large JPEG photos and a
+WHITE_FRAME) and reports the peak resident set size of a fresh process for
+the current overlay preparation and for the previous PIL pipeline
+(transform_image + second LANCZOS resize + np.array, WHITE_FRAME rebuilt
+per reel).
+
+Usage:
+    python bench_overlay_memory.py [--photo-size 6000x4000] [--reels 3] [--prep-only]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+VIDEO_SIZE = (1080, 1920)
+OVERLAYS = [
+    {"start_time": 0.0, "duration": 2.0, "image_path": "WHITE_FRAME", "width": 0.9, "height": 0.6, "opacity": 0.8},
+    {"start_time": 0.5, "duration": 1.5, "scale": 0.25, "rotation": 8, "opacity": 0.9},
+    {"start_time": 1.0, "duration": 1.5, "width": 0.8, "height": 0.35},
+    {"start_time": 1.5, "duration": 1.5, "scale": 0.2, "rotation": -12},
+]
+
+
+def legacy_prepare(rg, overlay, video_size):
+    """
+    The pre-change preparation path, kept here for comparison only.
+    """
+    width, height = overlay.get("width"), overlay.get("height")
+    rotation, opacity = overlay.get("rotation", 0), overlay.get("opacity", 1.0)
+    if overlay["image_path"] == "WHITE_FRAME":
+        w = rg.resolve_dimension(width, video_size[0]) or video_size[0]
+        h = rg.resolve_dimension(height, video_size[1]) or video_size[1]
+        img = Image.new("RGBA", (w, h), (255, 255, 255, int(255 * opacity)))
+        if rotation != 0:
+            img = img.rotate(-rotation, expand=True, fillcolor=(0, 0, 0, 0))
+        return np.array(img)
+    img = rg.transform_image(overlay["image_path"], scale=overlay.get("scale", 1.0), rotation=rotation, opacity=opacity)
+    if width is not None or height is not None:
+        w = rg.resolve_dimension(width, video_size[0]) or img.width
+        h = rg.resolve_dimension(height, video_size[1]) or img.height
+        img = img.resize((w, h), Image.Resampling.LANCZOS)
+    return np.array(img)
+
+
+def new_prepare(rg, overlay, video_size):
+    width, height = overlay.get("width"), overlay.get("height")
+    rotation, opacity = overlay.get("rotation", 0), overlay.get("opacity", 1.0)
+    if overlay["image_path"] == "WHITE_FRAME":
+        w = rg.resolve_dimension(width, video_size[0]) or video_size[0]
+        h = rg.resolve_dimension(height, video_size[1]) or video_size[1]
+        return rg.white_frame(w, h, opacity, rotation)
+    return rg.prepare_image_overlay(
+        overlay["image_path"], video_size, scale=overlay.get("scale", 1.0),
+        rotation=rotation, opacity=opacity, width=width, height=height
+    )
+
+
+def run_child(mode, workdir, reels, prep_only):
+    import reel_generation as rg
+
+    with open(os.path.join(workdir, "overlays.json")) as f:
+        overlays = json.load(f)
+    video_path = os.path.join(workdir, "template.mp4")
+
+    if mode == "legacy":
+        rg.prepare_image_overlay = lambda path, video_size, **kw: legacy_prepare(
+            rg, dict(kw, image_path=path), video_size
+        )
+        rg.white_frame = lambda w, h, opacity=1.0, rotation=0: legacy_prepare(
+            rg, {"image_path": "WHITE_FRAME", "width": w, "height": h, "opacity": opacity, "rotation": rotation},
+            (w, h)
+        )
+    prepare = legacy_prepare if mode == "legacy" else new_prepare
+
+    for r in range(reels):
+        if prep_only:
+            arrays = [prepare(rg, overlay, VIDEO_SIZE) for overlay in overlays]
+            del arrays
+        else:
+            rg.overlay_images_on_video(video_path, overlays, os.path.join(workdir, f"out-{mode}-{r}.mp4"))
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": mode, "peakRssMb": peak_kb / 1024.0}))
+
+
+def make_fixtures(workdir, photo_size):
+    from moviepy import ColorClip
+
+    rng = np.random.default_rng(0)
+    photo_w, photo_h = photo_size
+    overlays = []
+    for i, overlay in enumerate(OVERLAYS):
+        overlay = dict(overlay)
+        if "image_path" not in overlay:
+            path = os.path.join(workdir, f"photo-{i}.jpg")
+            small = rng.integers(0, 256, (photo_h // 16, photo_w // 16, 3), dtype=np.uint8)
+            Image.fromarray(small).resize((photo_w, photo_h), Image.Resampling.BILINEAR).save(path, quality=90)
+            overlay["image_path"] = path
+        overlays.append(overlay)
+    with open(os.path.join(workdir, "overlays.json"), "w") as f:
+        json.dump(overlays, f)
+
+    clip = ColorClip(VIDEO_SIZE, color=(20, 40, 80), duration=3.0)
+    clip.write_videofile(os.path.join(workdir, "template.mp4"), fps=24, codec="libx264", logger=None)
+    clip.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photo-size", default="6000x4000")
+    parser.add_argument("--reels", type=int, default=3)
+    parser.add_argument("--prep-only", action="store_true", help="Measure overlay preparation without rendering")
+    parser.add_argument("--child", choices=["legacy", "new"], help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.workdir, args.reels, args.prep_only)
+        return
+
+    photo_size = tuple(int(v) for v in args.photo_size.lower().split("x"))
+    with tempfile.TemporaryDirectory() as workdir:
+        make_fixtures(workdir, photo_size)
+        for mode in ("legacy", "new"):
+            cmd = [sys.executable, __file__, "--child", mode, "--workdir", workdir, "--reels", str(args.reels)]
+            if args.prep_only:
+                cmd.append("--prep-only")
+            output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:<7} peak RSS {result['peakRssMb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import os
 import cv2
 import re
+import functools
 import numpy as np
 import easyocr
 from ultralytics import YOLO
@@ -23,88 +24,306 @@ def preprocess_for_ocr(image_bgr):
     rep = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY)
     return rep
 
-def detect_and_tabulate_bibs_easyocr(
-    image_bytes,
-    image_name="input.jpg",
-    conf_threshold=0.5,
-    ocr_conf_threshold=0.6,
-    min_len=2,
-    max_len=5
-):
+@functools.lru_cache(maxsize=None)
+def get_models():
     """
-    Instead of separating and saving images, maintain a table with bib number and the photos in which they appear.
-    Returns a sorted list of detected bib numbers at the end of processing.
-    - conf_threshold: YOLO person detection confidence threshold
-    - ocr_conf_threshold: EasyOCR confidence threshold in [0, 1]
-    - min_len/max_len: min/max length of bib number string to keep
+    Load YOLO and the EasyOCR reader once per process and keep them resident.
+    Returns (yolo_model, easyocr_reader).
     """
-
     # Model load - YOLO will use cached model from /tmp/ultralytics if available
     # or download it automatically. The model is preloaded during Docker build.
     model = YOLO("yolov8n.pt")
-    person_class_id = 0
 
     # EasyOCR reader (English, CPU/GPU auto)
     reader = easyocr.Reader(["en"], gpu=True)
+    return model, reader
+
 
+def decode_image(image_bytes):
     np_buffer = np.frombuffer(image_bytes, dtype=np.uint8)
     img = cv2.imdecode(np_buffer, cv2.IMREAD_COLOR)
     if img is None:
         raise ValueError("Failed to decode image bytes.")
+    return img
 
-    print(f"[IMG] {image_name}")
 
-    # Detect persons only
+def _boxes_from_result(result, img_shape):
+    """
+    Clipped integer (x1, y1, x2, y2, conf) person boxes from one YOLO result.
+    """
+    if result.boxes is None:
+        return []
+    boxes = result.boxes
+    xyxy = boxes.xyxy.cpu().numpy() if hasattr(boxes.xyxy, "cpu") else boxes.xyxy
+    confs = boxes.conf.cpu().numpy() if hasattr(boxes.conf, "cpu") else boxes.conf
+
+    h, w = img_shape[:2]
+    person_boxes = []
+    for (x1, y1, x2, y2), det_conf in zip(xyxy, confs):
+        x1, y1, x2, y2 = map(int, [x1, y1, x2, y2])
+        x1 = max(0, x1); y1 = max(0, y1); x2 = min(w, x2); y2 = min(h, y2)
+        if x2 > x1 and y2 > y1:
+            person_boxes.append((x1, y1, x2, y2, float(det_conf)))
+    return person_boxes
+
+
+def detect_person_boxes(model, imgs, conf_threshold):
+    """
+    Run YOLO person detection on a list of decoded images in one batch.
+    Returns one list of person boxes per image.
+    """
+    if not imgs:
+        return []
     results = model.predict(
-        source=img, classes=[person_class_id], conf=conf_threshold, iou=0.5, verbose=False
+        source=list(imgs), classes=[0], conf=conf_threshold, iou=0.5, verbose=False
     )
+    return [_boxes_from_result(result, img.shape) for result, img in zip(results, imgs)]
+
+
+def _keep_bib(text, conf, ocr_conf_threshold, min_len, max_len):
+    """
+    Digits-only bib string if the OCR result passes the filters, else None.
+    """
+    text_clean = re.sub(r"[^0-9]", "", (text or "").strip())
+    if not text_clean:
+        return None
+    if not (min_len <= len(text_clean) <= max_len):
+        return None
+    if conf < ocr_conf_threshold:
+        return None
+    return text_clean
+
+
+def ocr_per_person(reader, img, person_boxes, ocr_conf_threshold=0.6, min_len=2, max_len=5):
+    """
+    Run EasyOCR (detection + recognition) inside every person crop.
+    """
     bibs = set()
+    for x1, y1, x2, y2, det_conf in person_boxes:
+        crop = img[y1:y2, x1:x2]
+        if crop.size == 0:
+            continue
+        print(f"  [BOX] ({x1},{y1},{x2},{y2}) conf={det_conf:.2f}")
 
-    if len(results) > 0 and results[0].boxes is not None:
-        boxes = results[0].boxes
-        xyxy = boxes.xyxy.cpu().numpy() if hasattr(boxes.xyxy, "cpu") else boxes.xyxy
-        confs = boxes.conf.cpu().numpy() if hasattr(boxes.conf, "cpu") else boxes.conf
-        print(f"[DETECT] persons={len(xyxy)} (conf>={conf_threshold})")
+        prep = preprocess_for_ocr(crop)
 
-        for (x1, y1, x2, y2), det_conf in zip(xyxy, confs):
-            x1, y1, x2, y2 = map(int, [x1, y1, x2, y2])
-            x1 = max(0, x1); y1 = max(0, y1); x2 = min(img.shape[1], x2); y2 = min(img.shape[0], y2)
-            if x2 <= x1 or y2 <= y1:
+        # EasyOCR expects BGR/RGB or grayscale; detail=1 returns (bbox, text, conf)
+        ocr_results = reader.readtext(
+            prep, detail=1, paragraph=False, slope_ths=0.1, height_ths=0.5
+        )
+        for bbox, text, conf in ocr_results:
+            bib = _keep_bib(text, conf, ocr_conf_threshold, min_len, max_len)
+            if bib is None:
                 continue
+            bibs.add(bib)
+            print(f"    [BIB] {bib} (OCR conf={conf:.2f})")
+    return bibs
+
 
-            crop = img[y1:y2, x1:x2]
-            if crop.size == 0:
+def _assign_to_person(region, person_boxes):
+    """
+    Index of the person box containing the centre of a text region
+    ([x_min, x_max, y_min, y_max]), preferring the smallest box when runners
+    overlap. None if the region is not on any person.
+    """
+    cx = (region[0] + region[1]) / 2.0
+    cy = (region[2] + region[3]) / 2.0
+    best, best_area = None, None
+    for i, (x1, y1, x2, y2, _) in enumerate(person_boxes):
+        if x1 <= cx <= x2 and y1 <= cy <= y2:
+            area = (x2 - x1) * (y2 - y1)
+            if best_area is None or area < best_area:
+                best, best_area = i, area
+    return best
+
+
+def ocr_fullframe(
+    reader, img, person_boxes, ocr_conf_threshold=0.6, min_len=2, max_len=5, detect_max_side=1600,
+    min_text_size=20
+):
+    """
+    Run text detection once over a downscaled copy of the whole image, keep
+    regions that fall on a person box and run only the recognizer on those.
+    - min_text_size: smallest text box kept, in full-resolution pixels (EasyOCR's
+      min_size, which would otherwise apply to the downscaled image)
+    """
+    if not person_boxes:
+        return set()
+
+    gray = preprocess_for_ocr(img)
+    h, w = gray.shape[:2]
+    scale = min(1.0, float(detect_max_side) / max(h, w))
+    small = gray if scale == 1.0 else cv2.resize(
+        gray, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA
+    )
+
+    horizontal_list, free_list = reader.detect(
+        small, min_size=max(1, int(round(min_text_size * scale))), slope_ths=0.1, height_ths=0.5
+    )
+    horizontal_list, free_list = horizontal_list[0], free_list[0]
+
+    # Map detections back to full-resolution coordinates
+    regions = [
+        [int(v / scale) for v in box] for box in horizontal_list
+    ]
+    polygons = [
+        [[int(x / scale), int(y / scale)] for x, y in poly] for poly in free_list
+    ]
+
+    kept_regions = [r for r in regions if _assign_to_person(r, person_boxes) is not None]
+    kept_polygons = []
+    for poly in polygons:
+        xs = [x for x, _ in poly]
+        ys = [y for _, y in poly]
+        if _assign_to_person([min(xs), max(xs), min(ys), max(ys)], person_boxes) is not None:
+            kept_polygons.append(poly)
+    print(f"[TEXT] regions={len(regions) + len(polygons)} on_persons={len(kept_regions) + len(kept_polygons)}")
+
+    bibs = set()
+    if kept_regions or kept_polygons:
+        ocr_results = reader.recognize(
+            gray,
+            horizontal_list=kept_regions,
+            free_list=kept_polygons,
+            detail=1,
+            paragraph=False
+        )
+        for bbox, text, conf in ocr_results:
+            bib = _keep_bib(text, conf, ocr_conf_threshold, min_len, max_len)
+            if bib is None:
                 continue
-            print(f"  [BOX] ({x1},{y1},{x2},{y2}) conf={float(det_conf):.2f}")
-
-            # Reuse same preprocessing from the original cell if available
-            try:
-                prep = preprocess_for_ocr(crop)
-            except NameError:
-                # Fallback simple grayscale if preprocess_for_ocr is not defined
-                prep = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
-
-            # EasyOCR expects BGR/RGB or grayscale; detail=1 returns (bbox, text, conf)
-            ocr_results = reader.readtext(
-                prep, detail=1, paragraph=False, slope_ths=0.1, height_ths=0.5
-            )
-            for bbox, text, conf in ocr_results:
-                text_clean = re.sub(r"[^0-9]", "", (text or "").strip())
-                if not text_clean:
-                    continue
-                if not (min_len <= len(text_clean) <= max_len):
-                    continue
-                if conf < ocr_conf_threshold:
-                    continue
-                bibs.add(text_clean)
-                print(f"    [BIB] {text_clean} (OCR conf={conf:.2f})")
-
-    if not bibs:
-        bibs = []
+            bibs.add(bib)
+            print(f"    [BIB] {bib} (OCR conf={conf:.2f})")
+    return bibs
+
+
+def detect_and_tabulate_bibs_easyocr(
+    image_bytes,
+    image_name="input.jpg",
+    conf_threshold=0.5,
+    ocr_conf_threshold=0.6,
+    min_len=2,
+    max_len=5
+):
+    """
+    Instead of separating and saving images, maintain a table with bib number and the photos in which they appear.
+    Returns a sorted list of detected bib numbers at the end of processing.
+    - conf_threshold: YOLO person detection confidence threshold
+    - ocr_conf_threshold: EasyOCR confidence threshold in [0, 1]
+    - min_len/max_len: min/max length of bib number string to keep
+    """
+    model, reader = get_models()
+    img = decode_image(image_bytes)
+
+    print(f"[IMG] {image_name}")
+
+    # Detect persons only
+    person_boxes = detect_person_boxes(model, [img], conf_threshold)[0]
+    print(f"[DETECT] persons={len(person_boxes)} (conf>={conf_threshold})")
+
+    bibs = ocr_per_person(reader, img, person_boxes, ocr_conf_threshold, min_len, max_len)
     print(f"[SUMMARY] {image_name}: {sorted(list(bibs))}")
 
     return sorted(bibs)
 
+
+def detect_and_tabulate_bibs_fullframe(
+    image_bytes,
+    image_name="input.jpg",
+    conf_threshold=0.5,
+    ocr_conf_threshold=0.6,
+    min_len=2,
+    max_len=5,
+    detect_max_side=1600,
+    min_text_size=20
+):
+    """
+    Single-pass alternative to detect_and_tabulate_bibs_easyocr.
+    Text detection (CRAFT) runs once over a downscaled copy of the whole image,
+    detected regions are assigned to YOLO person boxes by geometry, and only
+    the recognizer runs on the assigned regions at full resolution.
+    Overlapping runners are therefore never scanned twice.
+    - detect_max_side: longest side of the image fed to the text detector
+    - min_text_size: smallest text box kept, in full-resolution pixels
+    Other arguments and the return value match detect_and_tabulate_bibs_easyocr.
+    """
+    model, reader = get_models()
+    img = decode_image(image_bytes)
+
+    print(f"[IMG] {image_name}")
+
+    person_boxes = detect_person_boxes(model, [img], conf_threshold)[0]
+    print(f"[DETECT] persons={len(person_boxes)} (conf>={conf_threshold})")
+
+    bibs = ocr_fullframe(
+        reader, img, person_boxes, ocr_conf_threshold, min_len, max_len, detect_max_side, min_text_size
+    )
+    print(f"[SUMMARY] {image_name}: {sorted(list(bibs))}")
+
+    return sorted(bibs)
+
+
+EXTRACTION_STRATEGIES = {
+    "per_person": detect_and_tabulate_bibs_easyocr,
+    "fullframe": detect_and_tabulate_bibs_fullframe,
+}
+
+# Strategies callers may pick (extractionStrategy, inference server). fullframe
+# stays out until compare_extraction.py has measured its recall on crowded photos.
+ENABLED_STRATEGIES = ("per_person",)
+
+OCR_STAGES = {
+    "per_person": ocr_per_person,
+    "fullframe": ocr_fullframe,
+}
+
+
+def detect_bibs(image_bytes, strategy="per_person", **kwargs):
+    """
+    Run bib extraction with the named strategy (see EXTRACTION_STRATEGIES).
+    """
+    try:
+        extractor = EXTRACTION_STRATEGIES[strategy]
+    except KeyError:
+        raise ValueError(f"Unknown extraction strategy: {strategy}")
+    return extractor(image_bytes, **kwargs)
+
+
+def detect_bibs_batch(images, strategy="per_person", conf_threshold=0.5, **ocr_kwargs):
+    """
+    Extract bibs from several images at once: person detection runs as a
+    single YOLO batch, OCR then runs per image with the named strategy.
+    - images: list of (image_name, image_bytes)
+    Returns a list with one entry per image: a sorted bib list, or the
+    exception raised while decoding that image.
+    """
+    try:
+        ocr_stage = OCR_STAGES[strategy]
+    except KeyError:
+        raise ValueError(f"Unknown extraction strategy: {strategy}")
+    model, reader = get_models()
+
+    outputs = [None] * len(images)
+    decoded = []
+    for i, (image_name, image_bytes) in enumerate(images):
+        try:
+            decoded.append((i, image_name, decode_image(image_bytes)))
+        except Exception as exc:
+            outputs[i] = exc
+
+    imgs = [img for _, _, img in decoded]
+    print(f"[BATCH] images={len(imgs)} strategy={strategy}")
+    for (i, image_name, img), person_boxes in zip(decoded, detect_person_boxes(model, imgs, conf_threshold)):
+        print(f"[IMG] {image_name} persons={len(person_boxes)}")
+        try:
+            bibs = ocr_stage(reader, img, person_boxes, **ocr_kwargs)
+        except Exception as exc:
+            outputs[i] = exc
+            continue
+        print(f"[SUMMARY] {image_name}: {sorted(list(bibs))}")
+        outputs[i] = sorted(bibs)
+    return outputs
+
 # Example usage:
 # with open("/Users/phoenixa/Documents/projects/marathon/Edited/example.jpg", "rb") as f:
 #     photo_bytes = f.read()
@@ -0,0 +1,316 @@
+"""
+Compact per-event bib -> photo index.
+
+The index is a single little-endian binary file that can be memory-mapped and
+searched without parsing it up front:
+
+    header           magic (8 bytes), n_bibs (uint32), n_files (uint32)
+    bib_offsets      uint32[n_bibs + 1]   byte offsets into the bib blob
+    posting_offsets  uint32[n_bibs + 1]   entry offsets into the postings
+    file_offsets     uint32[n_files + 1]  byte offsets into the file blob
+    postings         uint32[...]          photo ids (indexes into the file table)
+    bib blob         utf-8 bib ids, sorted bytewise
+    file blob        utf-8 filenames, sorted bytewise (the string table)
+
+Bibs are sorted so a lookup is a binary search over bib_offsets; each bib's
+photo ids are sorted and de-duplicated.
+
+Freshness is tracked by a per-event state row in MarathonBibImages (keyed
+"BibIndexState#<event_id>" and without an EventId, so it stays out of the
+EventId-index GSI). PROCESS_IMAGES bumps its Writes counter in the same
+transaction that adds rows; a build records the Writes value it started from as IndexVersion, but
+only if Writes has not moved in the meantime. Index files are stored per
+version and lookups use one only while IndexVersion == Writes.
+"""
+import mmap
+import os
+import struct
+import tempfile
+
+MAGIC = b"BIBIDX01"
+HEADER = struct.Struct("<8sII")
+U32 = struct.Struct("<I")
+
+BIB_TABLE_NAME = "MarathonBibImages"
+
+
+def bib_index_s3_key(event_id, version):
+    return f"{event_id}/BibIndex/bib_index-{version}.bin"
+
+
+def _offsets(blobs):
+    offsets = [0]
+    for blob in blobs:
+        offsets.append(offsets[-1] + len(blob))
+    return offsets
+
+
+def build_bib_index(bib_to_filenames):
+    """
+    Serialise a {bib_id: iterable of filenames} mapping into the index format.
+    Returns the index as bytes.
+    """
+    filenames = sorted({str(f).encode("utf-8") for names in bib_to_filenames.values() for f in names})
+    file_ids = {name: i for i, name in enumerate(filenames)}
+
+    bibs = sorted(
+        (str(bib).encode("utf-8"), sorted({file_ids[str(f).encode("utf-8")] for f in names}))
+        for bib, names in bib_to_filenames.items()
+        if names
+    )
+
+    bib_offsets = _offsets([bib for bib, _ in bibs])
+    posting_offsets = _offsets([postings for _, postings in bibs])
+    file_offsets = _offsets(filenames)
+    postings = [photo_id for _, ids in bibs for photo_id in ids]
+
+    parts = [
+        HEADER.pack(MAGIC, len(bibs), len(filenames)),
+        struct.pack(f"<{len(bib_offsets)}I", *bib_offsets),
+        struct.pack(f"<{len(posting_offsets)}I", *posting_offsets),
+        struct.pack(f"<{len(file_offsets)}I", *file_offsets),
+        struct.pack(f"<{len(postings)}I", *postings),
+        b"".join(bib for bib, _ in bibs),
+        b"".join(filenames),
+    ]
+    return b"".join(parts)
+
+
+class BibIndex:
+    """
+    Read-only view over a serialised bib index (bytes, bytearray or mmap).
+    """
+
+    def __init__(self, buffer):
+        self._buf = memoryview(buffer)
+        magic, self.n_bibs, self.n_files = HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a bib index file (bad magic).")
+
+        pos = HEADER.size
+        self._bib_offsets = pos
+        pos += (self.n_bibs + 1) * U32.size
+        self._posting_offsets = pos
+        pos += (self.n_bibs + 1) * U32.size
+        self._file_offsets = pos
+        pos += (self.n_files + 1) * U32.size
+        self._postings = pos
+        pos += self._u32(self._posting_offsets, self.n_bibs) * U32.size
+        self._bib_blob = pos
+        pos += self._u32(self._bib_offsets, self.n_bibs)
+        self._file_blob = pos
+        pos += self._u32(self._file_offsets, self.n_files)
+        if pos != len(self._buf):
+            raise ValueError("Truncated or corrupt bib index file.")
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        Memory-map an index file from local disk.
+        """
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _u32(self, table, i):
+        return U32.unpack_from(self._buf, table + i * U32.size)[0]
+
+    def _bib_bytes(self, i):
+        start = self._bib_blob + self._u32(self._bib_offsets, i)
+        end = self._bib_blob + self._u32(self._bib_offsets, i + 1)
+        return self._buf[start:end].tobytes()
+
+    def filename(self, photo_id):
+        start = self._file_blob + self._u32(self._file_offsets, photo_id)
+        end = self._file_blob + self._u32(self._file_offsets, photo_id + 1)
+        return self._buf[start:end].tobytes().decode("utf-8")
+
+    def bibs(self):
+        return [self._bib_bytes(i).decode("utf-8") for i in range(self.n_bibs)]
+
+    def _find(self, bib_id):
+        key = str(bib_id).encode("utf-8")
+        lo, hi = 0, self.n_bibs
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bib_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_bibs and self._bib_bytes(lo) == key:
+            return lo
+        return None
+
+    def photo_ids(self, bib_id):
+        i = self._find(bib_id)
+        if i is None:
+            return []
+        start = self._u32(self._posting_offsets, i)
+        end = self._u32(self._posting_offsets, i + 1)
+        return [self._u32(self._postings, j) for j in range(start, end)]
+
+    def lookup(self, bib_id):
+        """
+        Return the sorted filenames the bib appears in ([] if unknown).
+        """
+        return [self.filename(photo_id) for photo_id in self.photo_ids(bib_id)]
+
+    def __contains__(self, bib_id):
+        return self._find(bib_id) is not None
+
+    def __len__(self):
+        return self.n_bibs
+
+    def to_dict(self):
+        return {bib: self.lookup(bib) for bib in self.bibs()}
+
+
+def fetch_bib_records(table, event_id):
+    """
+    Read every MarathonBibImages row for an event (following pagination) and
+    group filenames by bib.
+    """
+    from boto3.dynamodb.conditions import Key
+
+    bib_to_filenames = {}
+    query_kwargs = {
+        "IndexName": "EventId-index",
+        "KeyConditionExpression": Key("EventId").eq(str(event_id)),
+        "ProjectionExpression": "BibId, #fn",
+        "ExpressionAttributeNames": {"#fn": "filename"},
+    }
+    while True:
+        response = table.query(**query_kwargs)
+        for item in response.get("Items", []):
+            bib_to_filenames.setdefault(str(item["BibId"]), set()).add(item["filename"])
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            break
+        query_kwargs["ExclusiveStartKey"] = last_key
+    return bib_to_filenames
+
+
+
+
+def _state_key(event_id):
+    return {"EventImageId": f"BibIndexState#{event_id}"}
+
+
+def bib_writes_update(event_id):
+    """
+    TransactWriteItems "Update" action that bumps the event's write counter.
+    Send it in the same transaction as new MarathonBibImages rows so any
+    index built before them (or while they were being written) is not used.
+    """
+    return {
+        "TableName": BIB_TABLE_NAME,
+        "Key": _state_key(event_id),
+        "UpdateExpression": "ADD Writes :one",
+        "ExpressionAttributeValues": {":one": 1},
+    }
+
+
+def read_index_state(table, event_id):
+    """
+    Returns (writes, index_version) for an event; index_version is None when
+    no index has been published.
+    """
+    item = table.get_item(Key=_state_key(event_id), ConsistentRead=True).get("Item") or {}
+    version = item.get("IndexVersion")
+    return int(item.get("Writes", 0)), None if version is None else int(version)
+
+
+def load_bib_index(s3, bucket, event_id, version, cache_dir=None):
+    """
+    Memory-map one published index version, downloading it to cache_dir
+    (default: the temp dir) on first use. Versions are immutable, so a warm
+    container reuses the local copy. Returns None if the object is gone.
+    """
+    from botocore.exceptions import ClientError
+
+    path = os.path.join(cache_dir or tempfile.gettempdir(), f"bib_index-{event_id}-{version}.bin")
+    if not os.path.exists(path):
+        partial = f"{path}.{os.getpid()}.part"
+        try:
+            s3.download_file(bucket, bib_index_s3_key(event_id, version), partial)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        os.replace(partial, path)
+    return BibIndex.from_file(path)
+
+
+def query_bib_filenames(table, event_id, bib_id):
+    """
+    Filenames for one bib straight from MarathonBibImages (following
+    pagination). Used when an event has no current index.
+    """
+    from boto3.dynamodb.conditions import Key, Attr
+
+    filenames = set()
+    query_kwargs = {
+        "IndexName": "EventId-index",
+        "KeyConditionExpression": Key("EventId").eq(str(event_id)),
+        "FilterExpression": Attr("BibId").eq(str(bib_id)),
+    }
+    while True:
+        response = table.query(**query_kwargs)
+        filenames.update(item["filename"] for item in response.get("Items", []))
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            break
+        query_kwargs["ExclusiveStartKey"] = last_key
+    return sorted(filenames)
+
+
+def lookup_bib_filenames(ddb, s3, bucket, event_id, bib_id):
+    """
+    Sorted filenames for a bib, read from the event's index when it was built
+    at the current write count and from DynamoDB otherwise.
+    """
+    table = ddb.Table(BIB_TABLE_NAME)
+    writes, version = read_index_state(table, event_id)
+    if version is not None and version == writes:
+        index = load_bib_index(s3, bucket, event_id, version)
+        if index is not None:
+            return index.lookup(bib_id)
+    return query_bib_filenames(table, event_id, bib_id)
+
+
+def build_and_upload_bib_index(ddb, s3, bucket, event_id, attempts=3):
+    """
+    Build an event's index from MarathonBibImages, store it next to the photos
+    in S3 and publish it as the event's current version.
+    Publishing is conditional on no PROCESS_IMAGES write landing during the
+    build; if one does, the upload is discarded and the build retried.
+    Returns (s3_key, BibIndex).
+    """
+    table = ddb.Table(BIB_TABLE_NAME)
+    for _ in range(attempts):
+        writes, previous = read_index_state(table, event_id)
+        data = build_bib_index(fetch_bib_records(table, event_id))
+
+        s3_key = bib_index_s3_key(event_id, writes)
+        s3.put_object(
+            Bucket=bucket,
+            Key=s3_key,
+            Body=data,
+            ContentType="application/octet-stream"
+        )
+        try:
+            table.update_item(
+                Key=_state_key(event_id),
+                UpdateExpression="SET IndexVersion = :version",
+                ConditionExpression="Writes = :version" if writes else "attribute_not_exists(Writes)",
+                ExpressionAttributeValues={":version": writes}
+            )
+        except table.meta.client.exceptions.ConditionalCheckFailedException:
+            # New rows arrived mid-build; this version is already stale
+            s3.delete_object(Bucket=bucket, Key=s3_key)
+            continue
+
+        if previous is not None and previous != writes:
+            s3.delete_object(Bucket=bucket, Key=bib_index_s3_key(event_id, previous))
+        return s3_key, BibIndex(data)
+
+    raise RuntimeError(f"Bib index for event {event_id} kept changing during build; retry later")
@@ -0,0 +1,114 @@
+"""
+Compare bib extraction strategies on a folder of photos.
+
+Runs every strategy in bib_extraction.EXTRACTION_STRATEGIES over the same
+images and reports per-image latency and, when a ground-truth table is given
+(same layout as output/bib_table.json: {bib: [filenames]}), recall/precision.
+
+Usage:
+    python compare_extraction.py <images_dir> [--truth ../output/bib_table.json] [--limit N]
+        [--detect-max-side 1600] [--min-text-size 20]
+
+fullframe is not selectable through extractionStrategy (see
+bib_extraction.ENABLED_STRATEGIES) until this comparison has been run on a
+crowded sample; --detect-max-side and --min-text-size tune its text detector.
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from bib_extraction import EXTRACTION_STRATEGIES, detect_bibs
+
+
+def load_truth(path):
+    with open(path, "r") as f:
+        table = json.load(f)
+    truth = {}
+    for bib, filenames in table.items():
+        if bib == "unknown":
+            continue
+        for filename in filenames:
+            truth.setdefault(filename, set()).add(bib)
+    return truth
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_strategy(strategy, images, **kwargs):
+    latencies = []
+    found = {}
+    for filename, data in images:
+        start = time.perf_counter()
+        try:
+            bibs = detect_bibs(data, strategy=strategy, image_name=filename, **kwargs)
+        except Exception as exc:
+            print(f"[ERROR] {strategy} {filename}: {exc}")
+            bibs = []
+        latencies.append(time.perf_counter() - start)
+        found[filename] = set(bibs)
+    return latencies, found
+
+
+def score(found, truth):
+    tp = fp = fn = 0
+    for filename, expected in truth.items():
+        if filename not in found:
+            continue
+        got = found[filename]
+        tp += len(got & expected)
+        fp += len(got - expected)
+        fn += len(expected - got)
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    return recall, precision
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images_dir")
+    parser.add_argument("--truth", default=None)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--strategies", nargs="+", default=list(EXTRACTION_STRATEGIES))
+    parser.add_argument("--detect-max-side", type=int, default=1600, help="fullframe only")
+    parser.add_argument("--min-text-size", type=int, default=20, help="fullframe only")
+    args = parser.parse_args()
+
+    names = sorted(
+        f for f in os.listdir(args.images_dir)
+        if os.path.splitext(f)[1].lower() in (".jpg", ".jpeg", ".png")
+    )[:args.limit]
+    images = []
+    for name in names:
+        with open(os.path.join(args.images_dir, name), "rb") as f:
+            images.append((name, f.read()))
+    truth = load_truth(args.truth) if args.truth else None
+    strategy_kwargs = {
+        "fullframe": {"detect_max_side": args.detect_max_side, "min_text_size": args.min_text_size},
+    }
+
+    # Warm up model loading so it isn't charged to the first image
+    if images:
+        for strategy in args.strategies:
+            detect_bibs(images[0][1], strategy=strategy, image_name="warmup")
+
+    print(f"\n{'strategy':<12} {'images':>6} {'mean_s':>8} {'p50_s':>8} {'p95_s':>8} {'recall':>7} {'precision':>9}")
+    for strategy in args.strategies:
+        latencies, found = run_strategy(strategy, images, **strategy_kwargs.get(strategy, {}))
+        if not latencies:
+            continue
+        recall, precision = score(found, truth) if truth else (float("nan"), float("nan"))
+        print(
+            f"{strategy:<12} {len(latencies):>6} {statistics.mean(latencies):>8.3f} "
+            f"{percentile(latencies, 50):>8.3f} {percentile(latencies, 95):>8.3f} "
+            f"{recall:>7.3f} {precision:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Long-running bib extraction service for persistent CPU boxes.
+
+Models are loaded once and kept resident. Concurrent requests are gathered
+into micro-batches (up to --max-batch images, waiting at most --max-wait-ms
+after the first one arrives) so YOLO person detection runs once per batch.
+The request queue is bounded; when it is full new requests get HTTP 503 so
+callers can back off.
+
+Endpoints:
+    POST /extract?strategy=per_person&image_name=x.jpg   body: raw image bytes
+        -> {"ok": true, "bibs": [...], "totalMs": ...}
+        503 when the queue is full, 504 when the job waited past --request-timeout
+    GET  /stats   -> queue depth, batch sizes and latency percentiles
+    GET  /health  -> {"ok": true}
+
+Usage:
+    python inference_server.py --host 0.0.0.0 --port 8080 --max-batch 8 --max-wait-ms 25
+
+The Lambda handler uses it instead of in-process models when the
+INFERENCE_SERVER_URL environment variable is set (see extract_bibs_remote).
+"""
+import argparse
+import collections
+import json
+import queue
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Server-side limit on how long a queued job may wait for its result. The
+# client waits slightly longer so it always sees the server's 504 rather
+# than abandoning a job that the server would still run.
+REQUEST_TIMEOUT = 60.0
+CLIENT_TIMEOUT_SLACK = 5.0
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class InferenceUnavailableError(Exception):
+    """
+    The server could not take or finish the request (down, backpressure or
+    timeout). Callers should retry later instead of treating the image as
+    having no bibs.
+    """
+    pass
+
+
+class MicroBatcher:
+    """
+    Collects submitted images into batches and runs them on a worker thread.
+    """
+
+    def __init__(self, run_batch, max_batch=8, max_wait_ms=25, max_queue=64, stats_window=1000):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._queue_ms = collections.deque(maxlen=stats_window)
+        self._total_ms = collections.deque(maxlen=stats_window)
+        self._batch_sizes = collections.deque(maxlen=stats_window)
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+        self._dropped = 0
+        self._worker = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, image_name, image_bytes, strategy):
+        """
+        Queue one image. Returns a Future resolving to the sorted bib list.
+        Raises QueueFullError when the queue is at capacity.
+        """
+        future = Future()
+        try:
+            self._queue.put_nowait((time.perf_counter(), image_name, image_bytes, strategy, future))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise QueueFullError("Inference queue is full")
+        return future
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            # Skip jobs whose caller already timed out and cancelled them
+            live = [item for item in batch if item[4].set_running_or_notify_cancel()]
+            with self._lock:
+                self._dropped += len(batch) - len(live)
+            batch = live
+            if not batch:
+                continue
+            started = time.perf_counter()
+
+            by_strategy = collections.defaultdict(list)
+            for item in batch:
+                by_strategy[item[3]].append(item)
+
+            for strategy, items in by_strategy.items():
+                try:
+                    outputs = self.run_batch([(name, data) for _, name, data, _, _ in items], strategy)
+                except Exception as exc:
+                    outputs = [exc] * len(items)
+
+                finished = time.perf_counter()
+                for (enqueued, _, _, _, future), output in zip(items, outputs):
+                    with self._lock:
+                        self._queue_ms.append((started - enqueued) * 1000.0)
+                        self._total_ms.append((finished - enqueued) * 1000.0)
+                        if isinstance(output, Exception):
+                            self._failed += 1
+                        else:
+                            self._completed += 1
+                    if isinstance(output, Exception):
+                        future.set_exception(output)
+                    else:
+                        future.set_result(output)
+
+            with self._lock:
+                self._batch_sizes.append(len(batch))
+
+    def stats(self):
+        with self._lock:
+            queue_ms = sorted(self._queue_ms)
+            total_ms = sorted(self._total_ms)
+            batch_sizes = list(self._batch_sizes)
+            return {
+                "queueDepth": self._queue.qsize(),
+                "queueCapacity": self._queue.maxsize,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "dropped": self._dropped,
+                "meanBatchSize": sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0.0,
+                "queueMs": _percentiles(queue_ms),
+                "totalMs": _percentiles(total_ms),
+            }
+
+
+def _percentiles(ordered):
+    if not ordered:
+        return {}
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99), "max": ordered[-1]}
+
+
+def make_handler(batcher, request_timeout, strategies):
+
+    class InferenceHandler(BaseHTTPRequestHandler):
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = urllib.parse.urlparse(self.path).path
+            if path == "/stats":
+                self._send_json(200, batcher.stats())
+            elif path == "/health":
+                self._send_json(200, {"ok": True})
+            else:
+                self._send_json(404, {"ok": False, "error": "Not found"})
+
+        def do_POST(self):
+            parsed = urllib.parse.urlparse(self.path)
+            if parsed.path != "/extract":
+                self._send_json(404, {"ok": False, "error": "Not found"})
+                return
+            params = urllib.parse.parse_qs(parsed.query)
+            strategy = params.get("strategy", ["per_person"])[0]
+            image_name = params.get("image_name", ["request"])[0]
+            if strategy not in strategies:
+                self._send_json(400, {"ok": False, "error": f"Unsupported strategy: {strategy}"})
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            if length <= 0:
+                self._send_json(400, {"ok": False, "error": "Empty request body"})
+                return
+            image_bytes = self.rfile.read(length)
+
+            started = time.perf_counter()
+            try:
+                future = batcher.submit(image_name, image_bytes, strategy)
+            except QueueFullError as exc:
+                self._send_json(503, {"ok": False, "error": str(exc)})
+                return
+            try:
+                bibs = future.result(timeout=request_timeout)
+            except TimeoutError:
+                # Drops the job if it has not started yet
+                future.cancel()
+                self._send_json(504, {"ok": False, "error": "Timed out waiting for inference"})
+                return
+            except ValueError as exc:
+                self._send_json(400, {"ok": False, "error": str(exc)})
+                return
+            except Exception as exc:
+                self._send_json(500, {"ok": False, "error": str(exc)})
+                return
+            self._send_json(200, {
+                "ok": True,
+                "bibs": bibs,
+                "totalMs": (time.perf_counter() - started) * 1000.0
+            })
+
+        def log_message(self, format, *args):
+            pass
+
+    return InferenceHandler
+
+
+def extract_bibs_remote(
+    server_url,
+    image_bytes,
+    strategy="per_person",
+    image_name="s3_object",
+    timeout=REQUEST_TIMEOUT + CLIENT_TIMEOUT_SLACK,
+    retries=3,
+    backoff=0.5
+):
+    """
+    Client for the Lambda path: send one image to a running server and
+    return its bib list.
+    Backpressure (503) and connection failures are retried with exponential
+    backoff; if they persist, or the request times out, raises
+    InferenceUnavailableError. Other HTTP errors (bad image, extraction
+    failure on the server) are raised as urllib HTTPError.
+    """
+    query = urllib.parse.urlencode({"strategy": strategy, "image_name": image_name})
+    url = f"{server_url.rstrip('/')}/extract?{query}"
+
+    for attempt in range(retries + 1):
+        request = urllib.request.Request(
+            url,
+            data=image_bytes,
+            headers={"Content-Type": "application/octet-stream"},
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                payload = json.loads(response.read().decode("utf-8"))
+            return payload["bibs"]
+        except urllib.error.HTTPError as exc:
+            if exc.code == 504:
+                raise InferenceUnavailableError(f"Inference server timed out: {exc}")
+            if exc.code != 503:
+                raise
+            error = exc
+        except (TimeoutError, socket.timeout) as exc:
+            raise InferenceUnavailableError(f"Inference request timed out after {timeout}s")
+        except urllib.error.URLError as exc:
+            if isinstance(exc.reason, (TimeoutError, socket.timeout)):
+                raise InferenceUnavailableError(f"Inference request timed out after {timeout}s")
+            error = exc
+
+        if attempt < retries:
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+
+    raise InferenceUnavailableError(f"Inference server unavailable after {retries + 1} attempts: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bib extraction inference server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=25)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--request-timeout", type=float, default=REQUEST_TIMEOUT)
+    args = parser.parse_args()
+
+    from bib_extraction import detect_bibs_batch, get_models, ENABLED_STRATEGIES
+
+    print("[SERVER] Loading models...")
+    get_models()
+
+    batcher = MicroBatcher(
+        detect_bibs_batch,
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+        max_queue=args.max_queue
+    )
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(batcher, args.request_timeout, ENABLED_STRATEGIES))
+    print(f"[SERVER] Listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
 # processor.py
 import os, json, boto3, traceback, mimetypes
+from botocore.exceptions import ClientError
 from googleapiclient.discovery import build
 from google.oauth2 import service_account
-from bib_extraction import detect_and_tabulate_bibs_easyocr
-from reel_generation import overlay_images_on_video
+from bib_extraction import detect_bibs, ENABLED_STRATEGIES
+from reel_generation import overlay_images_on_video, reel_fingerprint
+from bib_index import build_and_upload_bib_index, lookup_bib_filenames, bib_writes_update
+from inference_server import extract_bibs_remote, InferenceUnavailableError
 import uuid
 
 # DynamoDB (schema: EventId (N) PK, DriveUrl (S), Status (S))
@@ -22,10 +25,17 @@ creds = service_account.Credentials.from_service_account_file(
 )
 drive = build("drive", "v3", credentials=creds)
 
+# Optional persistent inference server (see inference_server.py); in-process models when unset
+INFERENCE_SERVER_URL = os.environ.get("INFERENCE_SERVER_URL")
 
-def extract_bib_numbers(photo):
+
+def extract_bib_numbers(photo, strategy="per_person"):
+    if INFERENCE_SERVER_URL:
+        # Errors propagate: InferenceUnavailableError must fail the invocation
+        # so it is retried, rather than filing the photo as having no bibs
+        return extract_bibs_remote(INFERENCE_SERVER_URL, photo, strategy=strategy)
     try:
-        bib_numbers = detect_and_tabulate_bibs_easyocr(photo, image_name="s3_object")
+        bib_numbers = detect_bibs(photo, strategy=strategy, image_name="s3_object")
     except Exception as exc:
         print("[ERROR] Failed to extract bib numbers:", exc)
         bib_numbers = []
@@ -41,26 +51,39 @@ def add_photo(event_id, filename, bib_numbers):
       BibId       (String)
       EventId     (String or Number)
       filename    (String)
+    The rows and the event's bib-index write counter are written in one
+    transaction (at most 100 actions, so large bib lists are chunked).
     """
     table_name = 'MarathonBibImages'
-    table = ddb.Table(table_name)
-    for bib_id in bib_numbers:
-        event_image_id = str(uuid.uuid4())
-        item = {
-            "EventImageId": event_image_id,
-            "BibId": str(bib_id),
-            "EventId": str(event_id),
-            "filename": filename
-        }
+    bib_numbers = list(bib_numbers)
+    for start in range(0, len(bib_numbers), 99):
+        actions = []
+        for bib_id in bib_numbers[start:start + 99]:
+            actions.append({
+                "Put": {
+                    "TableName": table_name,
+                    "Item": {
+                        "EventImageId": str(uuid.uuid4()),
+                        "BibId": str(bib_id),
+                        "EventId": str(event_id),
+                        "filename": filename
+                    },
+                    # Only allow insert if EventImageId doesn't already exist
+                    "ConditionExpression": "attribute_not_exists(EventImageId)"
+                }
+            })
+        actions.append({"Update": bib_writes_update(event_id)})
         try:
-            # Only allow insert if EventImageId doesn't already exist
-            table.put_item(
-                Item=item,
-                ConditionExpression="attribute_not_exists(EventImageId)"
-            )
-        except ddb.meta.client.exceptions.ConditionalCheckFailedException:
-            # Collision occurred; surface it immediately
-            raise RuntimeError(f"UUID collision detected for EventImageId {event_image_id}")
+            ddb.meta.client.transact_write_items(TransactItems=actions)
+        except ddb.meta.client.exceptions.TransactionCanceledException as e:
+            reasons = e.response.get("CancellationReasons", [])
+            for action, reason in zip(actions, reasons):
+                if reason.get("Code") == "ConditionalCheckFailed":
+                    # Collision occurred; surface it immediately
+                    raise RuntimeError(
+                        f"UUID collision detected for EventImageId {action['Put']['Item']['EventImageId']}"
+                    )
+            raise
 
 
 def download_file(file_id):
@@ -97,6 +120,9 @@ def generateBibIds(event):
         raise ValueError("Missing eventId")
     if not file_id:
         raise ValueError("Missing fileId")
+    strategy = event.get("extractionStrategy", "per_person")
+    if strategy not in ENABLED_STRATEGIES:
+        raise ValueError(f"Unsupported extractionStrategy: {strategy}")
 
     # DynamoDB PK is Number, so convert
     try:
@@ -116,7 +142,7 @@ def generateBibIds(event):
 
         # 5) Run your processing/model here if needed
         try:
-            bib_numbers = extract_bib_numbers(data)
+            bib_numbers = extract_bib_numbers(data, strategy=strategy)
             
             if bib_numbers or len(bib_numbers) > 0:
                 s3_key = f"{event_id}/ProcessedImages/{filename}"
@@ -128,6 +154,8 @@ def generateBibIds(event):
             
             add_photo(event_id, filename, bib_numbers)
         
+        except InferenceUnavailableError:
+            raise
         except Exception:
             s3_key = f"{event_id}/UnProcessedImages/{filename}"
             upload_file(s3_key, data)
@@ -167,6 +195,32 @@ def generateBibIds(event):
         raise
 
 
+def parse_bool(value):
+    """
+    Strict boolean for event flags: "false", "0" and "" are False.
+    """
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("true", "1", "yes")
+
+
+def s3_object_exists(key):
+    try:
+        s3.head_object(Bucket=RAW_BUCKET, Key=key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
+
+
+def event_reel_id_for(event_id, bib_id):
+    """
+    Deterministic EventReel key: one row per event/bib.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{event_id}/{bib_id}"))
+
+
 def generateReel(event):
 
     print("Generating reel for bib_id", event.get("item"))
@@ -175,18 +229,11 @@ def generateReel(event):
     reel_config = event.get("reelConfiguration")
     bib_id = event.get("item")
 
-    from boto3.dynamodb.conditions import Key, Attr
-    table = ddb.Table('MarathonBibImages')
-    
-    response = table.query(
-        IndexName='EventId-index',
-        KeyConditionExpression=Key('EventId').eq(str(event_id)),
-        FilterExpression=Attr('BibId').eq(str(bib_id))
-    )
-    filenames = [item['filename'] for item in response.get('Items', [])]
+    # Bib index from S3 when built, DynamoDB query otherwise. Sorted so the
+    # photo -> overlay assignment (and the fingerprint) is stable across runs
+    filenames = lookup_bib_filenames(ddb, s3, RAW_BUCKET, event_id, bib_id)
     overlays = json.loads(reel_config).get("overlays")
 
-
     if len(filenames) < len(overlays):
         return {
             "eventId": str(event_id),
@@ -197,6 +244,32 @@ def generateReel(event):
             "error": f"Not enough images found for bib_id{bib_id}"
         }
 
+    filenames = filenames[:len(overlays)]
+    reel_path = f"{event_id}/ProcessedReels/{bib_id}.mp4"
+
+    # Skip the render if the stored reel was built from the same inputs
+    template_etag = s3.head_object(Bucket=RAW_BUCKET, Key=reel_s3_key)["ETag"]
+    photos = [
+        (filename, s3.head_object(Bucket=RAW_BUCKET, Key=f"{event_id}/ProcessedImages/{filename}")["ETag"])
+        for filename in filenames
+    ]
+    fingerprint = reel_fingerprint(photos, overlays, template_etag)
+    event_reel_table = ddb.Table('EventReel')
+    event_reel_id = event_reel_id_for(event_id, bib_id)
+    existing = event_reel_table.get_item(Key={'EventReelId': event_reel_id}).get('Item')
+
+    if existing and not parse_bool(event.get("force", False)):
+        if existing.get('Fingerprint') == fingerprint and s3_object_exists(existing.get('ReelPath', reel_path)):
+            print(f"Reel for bib_id {bib_id} is up to date, skipping")
+            return {
+                "eventId": str(event_id),
+                "bibId": str(bib_id),
+                "s3Bucket": RAW_BUCKET,
+                "processedReel": reel_path,
+                "ok": True,
+                "skipped": True
+            }
+
     # Download background video
     print("Downloading background video")
     local_video_path = os.path.join("/tmp", os.path.basename(reel_s3_key))
@@ -229,20 +302,17 @@ def generateReel(event):
     print("Overlaying images on video")
     overlay_images_on_video(local_video_path, overlays, output_path)
     print("Uploading processed reel")
-    s3.upload_file(output_path, RAW_BUCKET, f"{event_id}/ProcessedReels/{bib_id}.mp4")
+    s3.upload_file(output_path, RAW_BUCKET, reel_path)
 
-    # Write to DynamoDB EventReel table
+    # Write to DynamoDB EventReel table (one row per event/bib, overwritten on re-render)
     try:
-        event_reel_table = ddb.Table('EventReel')
-        event_reel_id = str(uuid.uuid4())
-        reel_path = f"{event_id}/ProcessedReels/{bib_id}.mp4"
-        
         event_reel_table.put_item(
             Item={
                 'EventReelId': event_reel_id,
                 'BibId': str(bib_id),
                 'EventId': int(event_id),
-                'ReelPath': reel_path
+                'ReelPath': reel_path,
+                'Fingerprint': fingerprint
             }
         )
     except Exception as e:
@@ -253,10 +323,76 @@ def generateReel(event):
         "eventId": str(event_id),
         "bibId": str(bib_id),
         "s3Bucket": RAW_BUCKET,
-        "processedReel": f"{event_id}/ProcessedReels/{bib_id}.mp4",
-        "ok": True
+        "processedReel": reel_path,
+        "ok": True,
+        "skipped": False
     }    
 
+def migrateEventReels(event):
+    """
+    One-off migration for EventReel rows written before keys were
+    deterministic (random uuid4 EventReelId). Each legacy row is moved to
+    event_reel_id_for(EventId, BibId), unless that row already exists, and
+    then deleted. Legacy rows have no Fingerprint, so the next GENERATE_REEL
+    for the bib re-renders once. Optional "eventId" limits the scan filter
+    to one event.
+    """
+    from boto3.dynamodb.conditions import Attr
+
+    table = ddb.Table('EventReel')
+    scan_kwargs = {}
+    if event.get("eventId") is not None:
+        scan_kwargs["FilterExpression"] = Attr('EventId').eq(int(event["eventId"]))
+
+    moved = deleted = 0
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get('Items', []):
+            event_reel_id = event_reel_id_for(int(item['EventId']), item['BibId'])
+            if item['EventReelId'] == event_reel_id:
+                continue
+            try:
+                table.put_item(
+                    Item=dict(item, EventReelId=event_reel_id),
+                    ConditionExpression="attribute_not_exists(EventReelId)"
+                )
+                moved += 1
+            except ddb.meta.client.exceptions.ConditionalCheckFailedException:
+                # Already rendered (or moved) under the deterministic key
+                pass
+            table.delete_item(Key={'EventReelId': item['EventReelId']})
+            deleted += 1
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            break
+        scan_kwargs["ExclusiveStartKey"] = last_key
+
+    print(f"EventReel migration: moved={moved} deleted={deleted}")
+    return {
+        "moved": moved,
+        "deleted": deleted,
+        "ok": True
+    }
+
+
+def buildBibIndex(event):
+    event_id = event.get("eventId")
+    if event_id is None:
+        raise ValueError("Missing eventId")
+
+    s3_key, index = build_and_upload_bib_index(ddb, s3, RAW_BUCKET, event_id)
+    print(f"Bib index for event {event_id}: bibs={index.n_bibs} files={index.n_files}")
+
+    return {
+        "eventId": str(event_id),
+        "s3Bucket": RAW_BUCKET,
+        "bibIndex": s3_key,
+        "bibCount": index.n_bibs,
+        "fileCount": index.n_files,
+        "ok": True
+    }
+
+
 def lambda_handler(event, context):
     """
     Expected input from Step Functions Map Parameters:
@@ -274,8 +410,15 @@ def lambda_handler(event, context):
             return generateBibIds(event)
         elif requestType == "GENERATE_REEL":
             return generateReel(event)
+        elif requestType == "BUILD_BIB_INDEX":
+            return buildBibIndex(event)
+        elif requestType == "MIGRATE_EVENT_REELS":
+            return migrateEventReels(event)
         else:
             raise ValueError("Invalid request type")
+    except InferenceUnavailableError:
+        # Fail the invocation so Step Functions retries it later
+        raise
     except Exception as e:
         print(f"Error: {e}")
         return {
@@ -0,0 +1,425 @@
+"""
+End-to-end load replay for lambda_function and v1 against local stand-ins.
+
+S3 and DynamoDB are served in-process by moto, Google Drive by FakeDrive
+(fixture images from --fixtures, or generated JPEGs). The harness creates the
+tables and bucket the handlers expect, seeds photos and bib rows for reel
+generation, then replays synthetic PROCESS_IMAGES, GENERATE_REEL and
+SQS-wrapped S3 events (v1.lambda_handler) at the requested concurrency.
+
+It reports throughput, latency percentiles per request type and a per-stage
+breakdown (Drive download, S3 and DynamoDB calls, extraction, rendering).
+
+By default extraction and rendering are replaced by fast fakes so the run
+measures the I/O paths; pass --real-extraction / --real-render (with
+--template) to include the models and moviepy.
+
+Usage:
+    python load_replay.py --process 200 --reels 20 --sqs 200 --concurrency 16
+
+Requires moto (pip install "moto[s3,dynamodb]") alongside the Lambda
+requirements.
+"""
+import argparse
+import collections
+import contextlib
+import glob
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import types
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+RAW_BUCKET = "marathon-load-replay"
+EVENT_ID = 4242
+SQS_EVENT_NAME = "replay-event"
+REGION = "ap-south-1"
+
+_stage_times = threading.local()
+
+
+def _record_stage(stage, elapsed):
+    stages = getattr(_stage_times, "current", None)
+    if stages is not None:
+        stages[stage] += elapsed
+
+
+def timed(stage, fn):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _record_stage(stage, time.perf_counter() - start)
+    return wrapper
+
+
+class TimedProxy:
+    """
+    Wraps a boto3 client/resource/table so every listed method call is
+    charged to a stage; other attributes pass straight through.
+    """
+
+    def __init__(self, target, stages):
+        self._target = target
+        self._stages = stages
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name == "Table":
+            return lambda *a, **kw: TimedProxy(attr(*a, **kw), self._stages)
+        if name == "meta" and hasattr(attr, "client"):
+            # resource.meta.client (e.g. transact_write_items)
+            return types.SimpleNamespace(client=TimedProxy(attr.client, self._stages))
+        if name in self._stages:
+            return timed(self._stages[name], attr)
+        return attr
+
+
+S3_STAGES = {
+    "put_object": "s3_upload",
+    "upload_file": "s3_upload",
+    "get_object": "s3_download",
+    "download_file": "s3_download",
+    "head_object": "s3_head",
+    "delete_object": "s3_delete",
+}
+DDB_STAGES = {
+    "put_item": "ddb_write",
+    "update_item": "ddb_write",
+    "transact_write_items": "ddb_write",
+    "get_item": "ddb_read",
+    "query": "ddb_read",
+    "scan": "ddb_read",
+    "delete_item": "ddb_write",
+}
+
+
+class FakeDrive:
+    """
+    Minimal stand-in for the googleapiclient Drive v3 service used by
+    lambda_function.download_file: files().get(...) and files().get_media(...).
+    """
+
+    def __init__(self, images, latency_ms=0.0):
+        self.images = images
+        self.latency = latency_ms / 1000.0
+
+    def _image(self, file_id):
+        index = int(file_id.rsplit("-", 1)[1])
+        return self.images[index % len(self.images)]
+
+    def _request(self, result):
+        if self.latency:
+            time.sleep(self.latency)
+        return mock.Mock(execute=lambda: result)
+
+    def files(self):
+        drive = self
+
+        class Files:
+            def get(self, fileId, fields=None):
+                return drive._request({"name": f"{fileId}.jpg", "mimeType": "image/jpeg"})
+
+            def get_media(self, fileId):
+                return drive._request(drive._image(fileId))
+
+        return Files()
+
+
+def load_fixture_images(fixtures_dir, count=8):
+    if fixtures_dir:
+        paths = sorted(
+            p for p in glob.glob(os.path.join(fixtures_dir, "*"))
+            if os.path.splitext(p)[1].lower() in (".jpg", ".jpeg", ".png")
+        )
+        if not paths:
+            raise ValueError(f"No fixture images found in {fixtures_dir}")
+        images = []
+        for path in paths:
+            with open(path, "rb") as f:
+                images.append(f.read())
+        return images
+
+    from PIL import Image
+
+    images = []
+    rng = random.Random(0)
+    for _ in range(count):
+        img = Image.effect_noise((1280, 853), rng.uniform(20, 80)).convert("RGB")
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=85)
+        images.append(buf.getvalue())
+    return images
+
+
+def fake_bibs(image_bytes, latency_ms):
+    if latency_ms:
+        time.sleep(latency_ms / 1000.0)
+    rng = random.Random(zlib.crc32(image_bytes))
+    return sorted({str(rng.randrange(100, 6000)) for _ in range(rng.randrange(0, 4))})
+
+
+def install_fake_extraction(latency_ms):
+    """
+    Register a stand-in bib_extraction module so importing the handlers does
+    not pull in torch, easyocr and ultralytics.
+    """
+    module = types.ModuleType("bib_extraction")
+    fake = lambda image_bytes, **kwargs: fake_bibs(image_bytes, latency_ms)
+    module.detect_bibs = fake
+    module.detect_and_tabulate_bibs_easyocr = fake
+    module.EXTRACTION_STRATEGIES = {"per_person": fake, "fullframe": fake}
+    module.ENABLED_STRATEGIES = ("per_person",)
+    sys.modules["bib_extraction"] = module
+
+
+def fake_render(video_path, overlays, output_path, latency_ms=0.0):
+    if latency_ms:
+        time.sleep(latency_ms / 1000.0)
+    with open(output_path, "wb") as f:
+        f.write(b"\0" * 1024)
+
+
+def create_resources(boto3):
+    s3 = boto3.client("s3", region_name=REGION)
+    s3.create_bucket(Bucket=RAW_BUCKET, CreateBucketConfiguration={"LocationConstraint": REGION})
+
+    ddb = boto3.client("dynamodb", region_name=REGION)
+    ddb.create_table(
+        TableName="MarathonBibImages",
+        KeySchema=[{"AttributeName": "EventImageId", "KeyType": "HASH"}],
+        AttributeDefinitions=[
+            {"AttributeName": "EventImageId", "AttributeType": "S"},
+            {"AttributeName": "EventId", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[{
+            "IndexName": "EventId-index",
+            "KeySchema": [{"AttributeName": "EventId", "KeyType": "HASH"}],
+            "Projection": {"ProjectionType": "ALL"},
+        }],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    ddb.create_table(
+        TableName="EventReel",
+        KeySchema=[{"AttributeName": "EventReelId", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "EventReelId", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    ddb.create_table(
+        TableName="marathon-photos",
+        KeySchema=[
+            {"AttributeName": "bib_no", "KeyType": "HASH"},
+            {"AttributeName": "event_name", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "bib_no", "AttributeType": "S"},
+            {"AttributeName": "event_name", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    return s3, boto3.resource("dynamodb", region_name=REGION)
+
+
+def build_events(args, images, s3, ddb):
+    """
+    Seed S3/DynamoDB and return a shuffled list of (kind, handler_name, event).
+    """
+    events = []
+
+    for i in range(args.process):
+        events.append(("PROCESS_IMAGES", "lambda_function", {
+            "requestType": "PROCESS_IMAGES",
+            "eventId": str(EVENT_ID),
+            "item": {"fileId": f"file-{i}"},
+        }))
+
+    if args.reels:
+        template_key = f"{EVENT_ID}/Templates/template.mp4"
+        if args.template:
+            s3.upload_file(args.template, RAW_BUCKET, template_key)
+        else:
+            s3.put_object(Bucket=RAW_BUCKET, Key=template_key, Body=b"\0" * 4096)
+
+        overlays = [
+            {"start_time": i * 1.0, "duration": 1.0, "position": "center", "width": 0.8}
+            for i in range(args.photos_per_reel)
+        ]
+        table = ddb.Table("MarathonBibImages")
+        for b in range(args.reels):
+            bib_id = str(9000 + b)
+            for p in range(args.photos_per_reel):
+                filename = f"reel-{bib_id}-{p}.jpg"
+                s3.put_object(
+                    Bucket=RAW_BUCKET,
+                    Key=f"{EVENT_ID}/ProcessedImages/{filename}",
+                    Body=images[(b + p) % len(images)],
+                )
+                table.put_item(Item={
+                    "EventImageId": f"seed-{bib_id}-{p}",
+                    "BibId": bib_id,
+                    "EventId": str(EVENT_ID),
+                    "filename": filename,
+                })
+            events.append(("GENERATE_REEL", "lambda_function", {
+                "requestType": "GENERATE_REEL",
+                "eventId": str(EVENT_ID),
+                "item": bib_id,
+                "reelS3Key": template_key,
+                "reelConfiguration": json.dumps({"overlays": overlays}),
+            }))
+
+    for i in range(args.sqs):
+        key = f"{SQS_EVENT_NAME}/sqs-{i}.jpg"
+        s3.put_object(Bucket=RAW_BUCKET, Key=key, Body=images[i % len(images)])
+        body = {"Records": [{
+            "eventSource": "aws:s3",
+            "eventName": "ObjectCreated:Put",
+            "s3": {"bucket": {"name": RAW_BUCKET}, "object": {"key": key}},
+        }]}
+        events.append(("SQS", "v1", {"Records": [{
+            "messageId": f"replay-{i}",
+            "eventSource": "aws:sqs",
+            "body": json.dumps(body),
+        }]}))
+
+    random.Random(args.seed).shuffle(events)
+    return events
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def report(results, wall):
+    print(f"\nReplayed {len(results)} events in {wall:.2f}s ({len(results) / wall:.1f} events/s)\n")
+    print(f"{'type':<16} {'count':>6} {'errors':>6} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9} {'max_ms':>9}")
+    by_kind = collections.defaultdict(list)
+    for result in results:
+        by_kind[result["kind"]].append(result)
+    for kind, rows in sorted(by_kind.items()):
+        latencies = [r["ms"] for r in rows]
+        errors = sum(1 for r in rows if not r["ok"])
+        print(
+            f"{kind:<16} {len(rows):>6} {errors:>6} {percentile(latencies, 50):>9.1f} "
+            f"{percentile(latencies, 95):>9.1f} {percentile(latencies, 99):>9.1f} {max(latencies):>9.1f}"
+        )
+
+    print(f"\n{'type':<16} {'stage':<14} {'mean_ms':>9} {'p95_ms':>9} {'share':>6}")
+    for kind, rows in sorted(by_kind.items()):
+        total = sum(r["ms"] for r in rows) or 1.0
+        stage_names = sorted({stage for r in rows for stage in r["stages"]})
+        for stage in stage_names:
+            values = [r["stages"].get(stage, 0.0) for r in rows]
+            print(
+                f"{kind:<16} {stage:<14} {statistics.mean(values):>9.1f} "
+                f"{percentile(values, 95):>9.1f} {sum(values) / total:>6.0%}"
+            )
+
+    failures = [r for r in results if not r["ok"]]
+    for r in failures[:5]:
+        print(f"[ERROR] {r['kind']}: {r['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--process", type=int, default=100, help="PROCESS_IMAGES events")
+    parser.add_argument("--reels", type=int, default=10, help="GENERATE_REEL events (one per bib)")
+    parser.add_argument("--sqs", type=int, default=100, help="SQS-wrapped S3 events for v1")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--photos-per-reel", type=int, default=4)
+    parser.add_argument("--fixtures", default=None, help="Directory of fixture images served by the fake Drive")
+    parser.add_argument("--drive-latency-ms", type=float, default=0.0)
+    parser.add_argument("--extract-latency-ms", type=float, default=0.0)
+    parser.add_argument("--render-latency-ms", type=float, default=0.0)
+    parser.add_argument("--real-extraction", action="store_true")
+    parser.add_argument("--real-render", action="store_true")
+    parser.add_argument("--template", default=None, help="Local background video for GENERATE_REEL")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Show the handlers' own output")
+    args = parser.parse_args()
+    if args.real_render and not args.template:
+        parser.error("--real-render needs --template")
+
+    try:
+        from moto import mock_aws
+    except ImportError:
+        raise SystemExit("load_replay needs moto: pip install 'moto[s3,dynamodb]'")
+
+    os.environ.update({
+        "RAW_BUCKET": RAW_BUCKET,
+        "GDRIVE_SA_PATH": "/dev/null",
+        "AWS_DEFAULT_REGION": REGION,
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+    })
+    os.environ.pop("INFERENCE_SERVER_URL", None)
+    images = load_fixture_images(args.fixtures)
+    drive = FakeDrive(images, latency_ms=args.drive_latency_ms)
+
+    with mock_aws(), \
+            mock.patch("google.oauth2.service_account.Credentials.from_service_account_file"), \
+            mock.patch("googleapiclient.discovery.build", return_value=drive):
+        import boto3
+        s3, ddb = create_resources(boto3)
+
+        if not args.real_extraction:
+            install_fake_extraction(args.extract_latency_ms)
+        import lambda_function
+        import v1
+
+        lambda_function.s3 = TimedProxy(lambda_function.s3, S3_STAGES)
+        lambda_function.ddb = TimedProxy(lambda_function.ddb, DDB_STAGES)
+        lambda_function.download_file = timed("drive_download", lambda_function.download_file)
+        v1.s3 = TimedProxy(v1.s3, S3_STAGES)
+        v1.dynamodb = TimedProxy(v1.dynamodb, DDB_STAGES)
+
+        lambda_function.extract_bib_numbers = timed("extract", lambda_function.extract_bib_numbers)
+        v1.extract_bib_numbers = timed("extract", v1.extract_bib_numbers)
+
+        render = lambda_function.overlay_images_on_video
+        if not args.real_render:
+            render = lambda video_path, overlays, output_path: fake_render(
+                video_path, overlays, output_path, args.render_latency_ms
+            )
+        lambda_function.overlay_images_on_video = timed("render", render)
+
+        handlers = {"lambda_function": lambda_function.lambda_handler, "v1": v1.lambda_handler}
+        events = build_events(args, images, s3, ddb)
+        print(f"Seeded {RAW_BUCKET}; replaying {len(events)} events at concurrency {args.concurrency}")
+
+        def run(entry):
+            kind, handler_name, event = entry
+            _stage_times.current = collections.defaultdict(float)
+            start = time.perf_counter()
+            ok, error = True, None
+            try:
+                response = handlers[handler_name](event, None)
+                if isinstance(response, dict) and response.get("ok") is False:
+                    ok, error = False, response.get("error")
+            except Exception as exc:
+                ok, error = False, repr(exc)
+            elapsed = (time.perf_counter() - start) * 1000.0
+            stages = {k: v * 1000.0 for k, v in _stage_times.current.items()}
+            _stage_times.current = None
+            return {"kind": kind, "ms": elapsed, "ok": ok, "error": error, "stages": stages}
+
+        handler_output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        started = time.perf_counter()
+        with handler_output, ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(run, events))
+        wall = time.perf_counter() - started
+
+    report(results, wall)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
 from moviepy import VideoFileClip, ImageClip, CompositeVideoClip
 from PIL import Image
 import numpy as np
+import cv2
+import functools
+import hashlib
+import json
+import math
 import os
 from pathlib import Path
 import subprocess
@@ -51,6 +56,191 @@ def transform_image(image_path, scale=1.0, rotation=0, opacity=1.0):
     return img
 
 
+def resolve_dimension(value, video_dim):
+    """
+    Overlay width/height: values <= 1.0 are a fraction of the video dimension,
+    larger values are pixels, None means unset.
+    """
+    if value is None:
+        return None
+    if value <= 1.0:
+        return int(video_dim * value)
+    return int(value)
+
+
+def rotated_size(width, height, rotation):
+    """
+    Bounding box of a width x height image rotated by `rotation` degrees,
+    matching PIL's rotate(expand=True).
+    """
+    if rotation % 360 == 0:
+        return int(width), int(height)
+    angle = math.radians(rotation)
+    c = round(math.cos(angle), 15)
+    s = round(math.sin(angle), 15)
+    cx, cy = width / 2.0, height / 2.0
+    corners = ((0, 0), (width, 0), (width, height), (0, height))
+    xs = [c * (x - cx) + s * (y - cy) + cx for x, y in corners]
+    ys = [-s * (x - cx) + c * (y - cy) + cy for x, y in corners]
+    return (
+        math.ceil(max(xs)) - math.floor(min(xs)),
+        math.ceil(max(ys)) - math.floor(min(ys)),
+    )
+
+
+def _resample(src, scaled_size, rotation, final_size):
+    """
+    Scale `src` to scaled_size, rotate clockwise by `rotation` degrees (canvas
+    expanded, transparent fill) and stretch to final_size. Shrinking is done
+    first with an area filter so the rotation never decimates without
+    anti-aliasing; rotation and stretch then share one warp.
+    Returns a new RGBA uint8 array.
+    """
+    out_w, out_h = final_size
+    if out_w <= 0 or out_h <= 0:
+        raise ValueError(f"Overlay size must be positive, got {out_w}x{out_h}")
+
+    if rotation % 360 == 0:
+        resized = _resize(src, (out_w, out_h))
+        return resized.copy() if resized is src else resized
+
+    scaled_w, scaled_h = scaled_size
+    rot_w, rot_h = rotated_size(scaled_w, scaled_h, rotation)
+
+    # Pre-shrink to the scaled size, or further when the final stretch
+    # shrinks too (keeping enough resolution for the less-shrunk axis)
+    shrink = min(1.0, max(out_w / rot_w, out_h / rot_h))
+    src = _resize(src, (max(1, round(scaled_w * shrink)), max(1, round(scaled_h * shrink))))
+    src_h, src_w = src.shape[:2]
+
+    angle = math.radians(rotation)
+    c, s = math.cos(angle), math.sin(angle)
+
+    # cv2 samples pixel i at coordinate i, so map pixel centres (i + 0.5)
+    # into continuous image space, rotate about the true centre, and shift
+    # back by half a pixel in the output
+    to_continuous = np.array([
+        [scaled_w / src_w, 0, 0.5 * scaled_w / src_w],
+        [0, scaled_h / src_h, 0.5 * scaled_h / src_h],
+        [0, 0, 1],
+    ])
+    from_centre = np.array([[1, 0, -scaled_w / 2.0], [0, 1, -scaled_h / 2.0], [0, 0, 1]])
+    rotate = np.array([[c, -s, 0], [s, c, 0], [0, 0, 1]])
+    to_canvas = np.array([[1, 0, rot_w / 2.0], [0, 1, rot_h / 2.0], [0, 0, 1]])
+    stretch = np.diag([out_w / rot_w, out_h / rot_h, 1.0])
+    to_pixels = np.array([[1, 0, -0.5], [0, 1, -0.5], [0, 0, 1]])
+    matrix = to_pixels @ stretch @ to_canvas @ rotate @ from_centre @ to_continuous
+
+    return cv2.warpAffine(
+        src,
+        matrix[:2],
+        (out_w, out_h),
+        flags=cv2.INTER_LANCZOS4,
+        borderMode=cv2.BORDER_CONSTANT,
+        borderValue=(0, 0, 0, 0),
+    )
+
+
+def _resize(src, size):
+    """
+    Resize to size with an area filter when shrinking, Lanczos otherwise.
+    Returns src itself when the size already matches.
+    """
+    src_h, src_w = src.shape[:2]
+    out_w, out_h = size
+    if (out_w, out_h) == (src_w, src_h):
+        return src
+    shrinking = out_w <= src_w and out_h <= src_h
+    interpolation = cv2.INTER_AREA if shrinking else cv2.INTER_LANCZOS4
+    return cv2.resize(src, (out_w, out_h), interpolation=interpolation)
+
+
+def _apply_opacity(rgba, opacity):
+    if opacity < 1.0:
+        alpha = rgba[:, :, 3]
+        np.multiply(alpha, opacity, out=alpha, casting="unsafe")
+    return rgba
+
+
+def prepare_image_overlay(image_path, video_size, scale=1.0, rotation=0, opacity=1.0, width=None, height=None):
+    """
+    Load a photo overlay as an RGBA array with scale, rotation and
+    width/height applied in one resampling step.
+    Same geometry as transform_image followed by the width/height resize:
+    scale, then rotate with an expanded canvas, then width/height override
+    the rotated size.
+
+    Args:
+        image_path: Path to the image file
+        video_size: (width, height) of the video, for fractional width/height
+        scale: Scaling factor (1.0 = original size)
+        rotation: Rotation angle in degrees
+        opacity: Opacity from 0.0 to 1.0
+        width, height: Optional final size (fraction of video if <= 1.0)
+
+    Returns:
+        numpy uint8 array of shape (h, w, 4)
+    """
+    img = Image.open(image_path)
+    orig_w, orig_h = img.size
+
+    scaled_w, scaled_h = orig_w, orig_h
+    if scale != 1.0:
+        scaled_w, scaled_h = int(orig_w * scale), int(orig_h * scale)
+    rot_w, rot_h = rotated_size(scaled_w, scaled_h, rotation)
+    out_w = resolve_dimension(width, video_size[0]) or rot_w
+    out_h = resolve_dimension(height, video_size[1]) or rot_h
+
+    # Let the JPEG decoder downscale by 2/4/8 when the output is much smaller
+    needed = max(out_w / rot_w, out_h / rot_h) * max(scaled_w / orig_w, scaled_h / orig_h)
+    if needed < 1.0:
+        img.draft(img.mode, (math.ceil(orig_w * needed), math.ceil(orig_h * needed)))
+
+    src = np.asarray(img.convert("RGBA"))
+    img.close()
+
+    rgba = _resample(src, (scaled_w, scaled_h), rotation, (out_w, out_h))
+    del src
+    return _apply_opacity(rgba, opacity)
+
+
+@functools.lru_cache(maxsize=8)
+def white_frame(width, height, opacity=1.0, rotation=0):
+    """
+    Shared read-only WHITE_FRAME overlay: a white width x height RGBA frame at
+    the given opacity, rotated with an expanded canvas if needed.
+    Generated once per (size, opacity, rotation) and reused across reels.
+    """
+    frame = np.empty((height, width, 4), dtype=np.uint8)
+    frame[:, :, :3] = 255
+    frame[:, :, 3] = int(255 * opacity)
+    if rotation % 360 != 0:
+        frame = _resample(frame, (width, height), rotation, rotated_size(width, height, rotation))
+    frame.setflags(write=False)
+    return frame
+
+
+def reel_fingerprint(photos, overlays, template_etag):
+    """
+    Stable hash of everything that determines a rendered reel.
+
+    Args:
+        photos: Ordered (filename, S3 ETag) pairs, one per overlay
+        overlays: Overlay configurations as received, before local image paths are filled in
+        template_etag: S3 ETag of the background video
+
+    Returns:
+        Hex digest string
+    """
+    payload = json.dumps(
+        {"photos": [list(photo) for photo in photos], "overlays": overlays, "template": template_etag},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
 def get_position(position, video_size, image_size):
     """
     Calculate the actual position coordinates.
@@ -116,36 +306,13 @@ def overlay_images_on_video(video_path, overlays, output_path):
         # Handle special "WHITE_FRAME" case
         if image_path == "WHITE_FRAME":
             print(f"\nProcessing overlay {i+1}:")
-            print(f"  Image: WHITE_FRAME (generating white image)")
+            print(f"  Image: WHITE_FRAME (shared white image)")
             print(f"  Time: {start_time:.2f}s - {end_time:.2f}s ({duration:.2f}s)")
-            
-            # Calculate dimensions
-            if width is not None:
-                if width <= 1.0:
-                    img_width = int(video_size[0] * width)
-                else:
-                    img_width = int(width)
-            else:
-                img_width = video_size[0]
-                
-            if height is not None:
-                if height <= 1.0:
-                    img_height = int(video_size[1] * height)
-                else:
-                    img_height = int(height)
-            else:
-                img_height = video_size[1]
-            
-            # Create white image with RGBA (white with full opacity)
-            white_img = Image.new("RGBA", (img_width, img_height), (255, 255, 255, int(255 * opacity)))
-            
-            # Apply rotation if needed
-            if rotation != 0:
-                white_img = white_img.rotate(-rotation, expand=True, fillcolor=(0, 0, 0, 0))
-            
-            # Convert PIL image to numpy array
-            img_array = np.array(white_img)
-            
+
+            img_width = resolve_dimension(width, video_size[0]) or video_size[0]
+            img_height = resolve_dimension(height, video_size[1]) or video_size[1]
+            img_array = white_frame(img_width, img_height, opacity, rotation)
+
         else:
             # Check if image exists
             if not os.path.exists(image_path):
@@ -157,33 +324,15 @@ def overlay_images_on_video(video_path, overlays, output_path):
             print(f"  Time: {start_time:.2f}s - {end_time:.2f}s ({duration:.2f}s)")
             print(f"  Scale: {scale}, Rotation: {rotation}°, Opacity: {opacity}")
             
-            # Transform the image
-            transformed_img = transform_image(image_path, scale=scale, rotation=rotation, opacity=opacity)
-            
-            # Apply width/height if specified (override scale)
-            if width is not None or height is not None:
-                current_w, current_h = transformed_img.size
-                
-                if width is not None:
-                    if width <= 1.0:
-                        new_width = int(video_size[0] * width)
-                    else:
-                        new_width = int(width)
-                else:
-                    new_width = current_w
-                    
-                if height is not None:
-                    if height <= 1.0:
-                        new_height = int(video_size[1] * height)
-                    else:
-                        new_height = int(height)
-                else:
-                    new_height = current_h
-                
-                transformed_img = transformed_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            
-            # Convert PIL image to numpy array
-            img_array = np.array(transformed_img)
+            img_array = prepare_image_overlay(
+                image_path,
+                video_size,
+                scale=scale,
+                rotation=rotation,
+                opacity=opacity,
+                width=width,
+                height=height
+            )
         
         # Create ImageClip from the transformed image
         # In moviepy 2.x, duration is set in constructor, and use with_* methods instead of set_*
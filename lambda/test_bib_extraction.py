@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import bib_extraction as be
+
+
+PERSONS = [
+    (0, 0, 100, 200, 0.9),
+    (40, 20, 80, 120, 0.8),
+    (300, 0, 400, 200, 0.7),
+]
+
+
+@pytest.mark.parametrize("region, expected", [
+    ([10, 20, 150, 160], 0),     # centre (15, 155) only inside the first box
+    ([50, 70, 60, 80], 1),       # inside boxes 0 and 1: the smaller one wins
+    ([310, 390, 90, 110], 2),
+    ([150, 250, 50, 60], None),  # between runners
+    ([90, 130, 10, 30], None),   # overlaps box 0 but its centre is outside
+])
+def test_assign_to_person(region, expected):
+    assert be._assign_to_person(region, PERSONS) == expected
+
+
+def test_assign_to_person_edges_and_empty():
+    assert be._assign_to_person([100, 100, 200, 200], PERSONS) == 0
+    assert be._assign_to_person([10, 20, 10, 20], []) is None
+
+
+class FakeReader:
+    """
+    Stands in for easyocr.Reader: detect() returns fixed regions in the
+    coordinates of the image it was given, recognize() echoes a bib per region.
+    """
+
+    def __init__(self, horizontal, free=()):
+        self.horizontal = horizontal
+        self.free = list(free)
+        self.detect_calls = []
+        self.recognize_calls = []
+
+    def detect(self, img, **kwargs):
+        self.detect_calls.append((img.shape, kwargs))
+        return [self.horizontal], [self.free]
+
+    def recognize(self, img, horizontal_list, free_list, **kwargs):
+        self.recognize_calls.append((img.shape, horizontal_list, free_list))
+        return [(box, str(1000 + i), 0.9) for i, box in enumerate(horizontal_list + free_list)]
+
+
+def test_ocr_fullframe_maps_regions_back_to_full_resolution():
+    img = np.zeros((2000, 4000, 3), dtype=np.uint8)
+    persons = [(0, 0, 1000, 2000, 0.9)]
+    # Detection runs at scale 0.4 (4000 -> 1600); the second region is off-person
+    reader = FakeReader(
+        horizontal=[[100, 140, 200, 220], [1000, 1040, 200, 220]],
+        free=[[[10, 10], [30, 10], [30, 20], [10, 20]]],
+    )
+
+    bibs = be.ocr_fullframe(reader, img, persons, detect_max_side=1600, min_text_size=20)
+
+    (small_shape, detect_kwargs), = reader.detect_calls
+    assert small_shape == (800, 1600)
+    assert detect_kwargs["min_size"] == 8
+    (full_shape, horizontal, free), = reader.recognize_calls
+    assert full_shape == (2000, 4000)
+    assert horizontal == [[250, 350, 500, 550]]
+    assert free == [[[25, 25], [75, 25], [75, 50], [25, 50]]]
+    assert bibs == {"1000", "1001"}
+
+
+def test_ocr_fullframe_skips_ocr_without_persons():
+    reader = FakeReader(horizontal=[[0, 10, 0, 10]])
+    assert be.ocr_fullframe(reader, np.zeros((10, 10, 3), dtype=np.uint8), []) == set()
+    assert not reader.detect_calls
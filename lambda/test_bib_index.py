@@ -0,0 +1,173 @@
+import pytest
+
+import bib_index as bi
+
+
+MAPPING = {
+    "5040": ["Sarthi Studios-1000.jpg", "Sarthi Studios-1001.jpg"],
+    "65": ["Sarthi Studios-1000.jpg"],
+    "1075": ["Sarthi Studios-1001.jpg", "Sarthi Studios-1000.jpg", "Sarthi Studios-1000.jpg"],
+}
+
+
+def test_round_trip():
+    index = bi.BibIndex(bi.build_bib_index(MAPPING))
+    assert len(index) == 3
+    assert index.n_files == 2
+    assert index.bibs() == ["1075", "5040", "65"]
+    assert index.lookup("1075") == ["Sarthi Studios-1000.jpg", "Sarthi Studios-1001.jpg"]
+    assert index.lookup(65) == ["Sarthi Studios-1000.jpg"]
+    assert index.lookup("999") == []
+    assert "5040" in index and "504" not in index
+    assert index.to_dict() == {bib: sorted(set(names)) for bib, names in MAPPING.items()}
+
+
+def test_empty_index():
+    data = bi.build_bib_index({"77": []})
+    assert len(data) == bi.HEADER.size + 3 * bi.U32.size
+    index = bi.BibIndex(data)
+    assert len(index) == 0
+    assert index.lookup("77") == []
+    assert index.to_dict() == {}
+
+
+def test_non_ascii_filenames():
+    mapping = {"12": ["Läufer-ü.jpg", "跑者.jpg"], "3": ["Läufer-ü.jpg"]}
+    index = bi.BibIndex(bi.build_bib_index(mapping))
+    assert index.lookup("12") == sorted(mapping["12"], key=lambda f: f.encode("utf-8"))
+    assert index.lookup("3") == ["Läufer-ü.jpg"]
+
+
+def test_from_file_memory_maps(tmp_path):
+    path = tmp_path / "bib_index.bin"
+    path.write_bytes(bi.build_bib_index(MAPPING))
+    index = bi.BibIndex.from_file(str(path))
+    assert index.to_dict() == bi.BibIndex(path.read_bytes()).to_dict()
+
+
+def test_bad_magic():
+    data = bytearray(bi.build_bib_index(MAPPING))
+    data[:8] = b"NOTANIDX"
+    with pytest.raises(ValueError, match="bad magic"):
+        bi.BibIndex(bytes(data))
+
+
+@pytest.mark.parametrize("cut", [1, 5])
+def test_truncated(cut):
+    data = bi.build_bib_index(MAPPING)
+    with pytest.raises(ValueError, match="Truncated"):
+        bi.BibIndex(data[:-cut])
+
+
+def test_trailing_bytes():
+    with pytest.raises(ValueError, match="Truncated"):
+        bi.BibIndex(bi.build_bib_index(MAPPING) + b"\0")
+
+
+@pytest.fixture
+def aws(tmp_path, monkeypatch):
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setattr(bi.tempfile, "gettempdir", lambda: str(tmp_path))
+    with moto.mock_aws():
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket="photos")
+        ddb = boto3.resource("dynamodb")
+        ddb.create_table(
+            TableName=bi.BIB_TABLE_NAME,
+            KeySchema=[{"AttributeName": "EventImageId", "KeyType": "HASH"}],
+            AttributeDefinitions=[
+                {"AttributeName": "EventImageId", "AttributeType": "S"},
+                {"AttributeName": "EventId", "AttributeType": "S"},
+            ],
+            GlobalSecondaryIndexes=[{
+                "IndexName": "EventId-index",
+                "KeySchema": [{"AttributeName": "EventId", "KeyType": "HASH"}],
+                "Projection": {"ProjectionType": "ALL"},
+            }],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield ddb, s3
+
+
+def add_rows(ddb, event_id, bib_id, *filenames):
+    actions = [
+        {"Put": {"TableName": bi.BIB_TABLE_NAME, "Item": {
+            "EventImageId": f"{event_id}-{bib_id}-{filename}",
+            "EventId": str(event_id),
+            "BibId": str(bib_id),
+            "filename": filename,
+        }}}
+        for filename in filenames
+    ]
+    ddb.meta.client.transact_write_items(TransactItems=actions + [{"Update": bi.bib_writes_update(event_id)}])
+
+
+def test_lookup_uses_index_until_new_rows(aws, monkeypatch):
+    ddb, s3 = aws
+    add_rows(ddb, 7, "101", "a.jpg", "b.jpg")
+    s3_key, index = bi.build_and_upload_bib_index(ddb, s3, "photos", 7)
+    assert s3_key == bi.bib_index_s3_key(7, 1)
+    assert index.lookup("101") == ["a.jpg", "b.jpg"]
+    # The state row must not show up as an event row
+    assert bi.fetch_bib_records(ddb.Table(bi.BIB_TABLE_NAME), 7) == {"101": {"a.jpg", "b.jpg"}}
+
+    queries = []
+    query = bi.query_bib_filenames
+    monkeypatch.setattr(bi, "query_bib_filenames", lambda *a: queries.append(a) or query(*a))
+
+    assert bi.lookup_bib_filenames(ddb, s3, "photos", 7, "101") == ["a.jpg", "b.jpg"]
+    assert not queries
+
+    add_rows(ddb, 7, "101", "c.jpg")
+    assert bi.lookup_bib_filenames(ddb, s3, "photos", 7, "101") == ["a.jpg", "b.jpg", "c.jpg"]
+    assert len(queries) == 1
+
+    s3_key, _ = bi.build_and_upload_bib_index(ddb, s3, "photos", 7)
+    assert s3_key == bi.bib_index_s3_key(7, 2)
+    assert [o["Key"] for o in s3.list_objects_v2(Bucket="photos")["Contents"]] == [s3_key]
+    assert bi.lookup_bib_filenames(ddb, s3, "photos", 7, "101") == ["a.jpg", "b.jpg", "c.jpg"]
+    assert len(queries) == 1
+
+
+def test_build_is_not_published_over_concurrent_write(aws, monkeypatch):
+    ddb, s3 = aws
+    add_rows(ddb, 7, "101", "a.jpg")
+    fetch = bi.fetch_bib_records
+    writes_during_build = [("101", "late.jpg")]
+
+    def fetch_then_write(table, event_id):
+        records = fetch(table, event_id)
+        if writes_during_build:
+            add_rows(ddb, event_id, *writes_during_build.pop())
+        return records
+
+    monkeypatch.setattr(bi, "fetch_bib_records", fetch_then_write)
+    s3_key, index = bi.build_and_upload_bib_index(ddb, s3, "photos", 7)
+
+    # First attempt saw only a.jpg and was discarded; the retry picked up late.jpg
+    assert s3_key == bi.bib_index_s3_key(7, 2)
+    assert index.lookup("101") == ["a.jpg", "late.jpg"]
+    assert [o["Key"] for o in s3.list_objects_v2(Bucket="photos")["Contents"]] == [s3_key]
+    assert bi.lookup_bib_filenames(ddb, s3, "photos", 7, "101") == ["a.jpg", "late.jpg"]
+
+
+def test_build_gives_up_while_writes_continue(aws, monkeypatch):
+    ddb, s3 = aws
+    add_rows(ddb, 7, "101", "a.jpg")
+    fetch = bi.fetch_bib_records
+
+    def fetch_then_write(table, event_id):
+        records = fetch(table, event_id)
+        add_rows(ddb, event_id, "101", f"late-{len(records['101'])}.jpg")
+        return records
+
+    monkeypatch.setattr(bi, "fetch_bib_records", fetch_then_write)
+    with pytest.raises(RuntimeError, match="kept changing"):
+        bi.build_and_upload_bib_index(ddb, s3, "photos", 7, attempts=2)
+    assert s3.list_objects_v2(Bucket="photos").get("KeyCount") == 0
+    assert bi.read_index_state(ddb.Table(bi.BIB_TABLE_NAME), 7) == (3, None)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import reel_generation as rg
+
+
+@pytest.fixture
+def rgba():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (6, 8, 4), dtype=np.uint8)
+
+
+def test_rotate_180_is_exact_flip(rgba):
+    out = rg._resample(rgba, (8, 6), 180, (8, 6))
+    np.testing.assert_array_equal(out, np.flip(rgba, (0, 1)))
+
+
+@pytest.mark.parametrize("rotation, k", [(90, -1), (-90, 1), (270, 1)])
+def test_rotate_quarter_turns_match_rot90(rgba, rotation, k):
+    size = rg.rotated_size(8, 6, rotation)
+    assert size == (6, 8)
+    out = rg._resample(rgba, (8, 6), rotation, size)
+    np.testing.assert_array_equal(out, np.rot90(rgba, k=k))
+
+
+def test_rotated_white_frame_has_no_transparent_border():
+    frame = rg.white_frame(40, 30, 1.0, 180)
+    assert frame.shape == (30, 40, 4)
+    assert frame[:, :, 3].min() == 255
+    assert not frame.flags.writeable
+
+
+def test_prepare_image_overlay_rotates_file(tmp_path, rgba):
+    path = tmp_path / "overlay.png"
+    Image.fromarray(rgba).save(path)
+    out = rg.prepare_image_overlay(str(path), (1080, 1920), rotation=90, opacity=0.5)
+    expected = np.rot90(rgba, k=-1).copy()
+    expected[:, :, 3] = (expected[:, :, 3] * 0.5).astype(np.uint8)
+    np.testing.assert_array_equal(out, expected)